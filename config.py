@@ -0,0 +1,11 @@
+"""Shared configuration helpers for the trends-story scripts."""
+
+import pathlib
+from functools import lru_cache
+
+SERP_API_TOKEN_FILE = "serp_token.txt"
+
+@lru_cache(maxsize=1)
+def get_api_key():
+    """Read the SerpAPI token once and cache it for the process lifetime"""
+    return pathlib.Path(SERP_API_TOKEN_FILE).read_text().strip()
@@ -2,7 +2,7 @@ import json
 import os
 import random
 import uuid
-import websocket
+from websockets.sync.client import connect
 import urllib.request
 import urllib.parse
 from datetime import datetime
@@ -82,10 +82,11 @@ def create_image_from_prompt(prompt_text, query_for_filename):
     prompt_workflow["9"]["inputs"]["filename_prefix"] = filename_prefix
     
     # --- Queue the prompt and get the image ---
-    ws = websocket.WebSocket()
+    ws = None
     try:
-        ws.connect(f"ws://{SERVER_ADDRESS}/ws?clientId={CLIENT_ID}")
-        
+        ws = connect(f"ws://{SERVER_ADDRESS}/ws?clientId={CLIENT_ID}")
+
+
         # Queue the prompt
         prompt_data = queue_prompt(prompt_workflow)
         if not prompt_data or 'prompt_id' not in prompt_data:
@@ -125,7 +126,8 @@ def create_image_from_prompt(prompt_text, query_for_filename):
     except Exception as e:
         print(f"An error occurred: {e}")
     finally:
-        ws.close()
+        if ws is not None:
+            ws.close()
 
 # --- Main execution ---
 if __name__ == "__main__":
@@ -5,33 +5,81 @@ Handles lockfile management, script execution, and automated git sync.
 """
 
 import subprocess
+import select
 import sys
+import threading
 import os
+import fcntl
 import datetime
 import time
-import yaml
+import re
+from zoneinfo import ZoneInfo
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import MemoryHandler
 from pathlib import Path
 import json
 import shutil
 import sqlite3
 
+def _yaml_load(text):
+    """Parse YAML with the libyaml C loader when the extension is available.
+
+    PyYAML is imported here rather than at module level: with the parsed
+    config cached on disk, most runs never need it at all.
+    """
+    try:
+        from yaml import load as _load, CSafeLoader as _Loader
+    except ImportError:
+        from yaml import load as _load, SafeLoader as _Loader
+    return _load(text, Loader=_Loader)
+
+
+def _load_config_file(path):
+    """Load a YAML config file through its JSON sidecar cache.
+
+    The sidecar (<path>.cache.json) stores an mtime+size key on its first
+    line and the parsed document as JSON below it; a matching key skips the
+    YAML parse entirely. The cache is best-effort: any failure to read or
+    write it just falls back to parsing.
+    """
+    path = Path(path)
+    st = path.stat()
+    cache_key = f"{st.st_mtime_ns}:{st.st_size}"
+    cache_path = path.with_name(path.name + ".cache.json")
+    try:
+        key, _, body = cache_path.read_text(encoding='utf-8').partition('\n')
+        if key == cache_key:
+            return json.loads(body)
+    except (OSError, ValueError):
+        pass
+
+    config = _yaml_load(path.read_text(encoding='utf-8'))
+    try:
+        # Write-then-rename keeps a racing run from reading a half-written
+        # cache
+        tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+        tmp_path.write_text(f"{cache_key}\n{json.dumps(config)}", encoding='utf-8')
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError):
+        pass
+    return config
+
+
+# Candidate config locations, checked in order
+_CONFIG_SEARCH_PATHS = (
+    Path("/app/trends-story/config.yaml"),
+    Path("./config.yaml"),
+    Path.cwd() / "config.yaml",
+)
+
+
 # Load base directory from config
 def get_base_dir_from_config():
     """Get base directory from config file."""
-    config_paths = [
-        "/app/trends-story/config.yaml",
-        "./config.yaml",
-        Path.cwd() / "config.yaml"
-    ]
-    
-    for config_path in config_paths:
-        config_path = Path(config_path)
+    for config_path in _CONFIG_SEARCH_PATHS:
         if config_path.exists():
             try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config = yaml.safe_load(f)
+                config = _load_config_file(config_path)
                 return Path(config.get('base_dir', '/app/trends-story'))
             except Exception:
                 continue
@@ -46,9 +94,10 @@ LAST_RUN_FILE = BASE_DIR / ".last_run"
 CONFIG_FILE = BASE_DIR / "config.yaml"
 LOG_DIR = BASE_DIR / "logs"
 SCRIPT_PATH = BASE_DIR / "creating-stories.py"
-LOCKFILE_STALE_MINUTES = 30
 MAX_RETRIES = 3
 RETRY_BASE_DELAY = 2  # seconds
+# DST-aware, unlike the old fixed -5 offset; matches the story scripts
+NY_TZ = ZoneInfo("America/New_York")
 
 # Exit codes
 EXIT_SUCCESS = 0
@@ -57,25 +106,62 @@ EXIT_SCRIPT_FAILURE = 2
 EXIT_GIT_FAILURE = 3
 
 
-def setup_logging():
-    """Setup dual logging to stdout and rotating file."""
+class _CachedTimeFormatter(logging.Formatter):
+    """Formatter that reuses the rendered asctime within the same second.
+
+    While streaming script output, bursts of records land in the same
+    second; caching saves a strftime (and struct_time allocation) for all
+    but the first record of each second.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._time_cache = (None, "")
+
+    def formatTime(self, record, datefmt=None):
+        second = int(record.created)
+        cached_second, cached_text = self._time_cache
+        if second != cached_second:
+            cached_text = super().formatTime(record, datefmt)
+            self._time_cache = (second, cached_text)
+        return cached_text
+
+
+def setup_logging(run_date):
+    """Setup dual logging to stdout and daily file."""
     # Create logs directory if it doesn't exist
     LOG_DIR.mkdir(parents=True, exist_ok=True)
-    
-    # Get current date in NY timezone
-    ny_date = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=-5)))
-    log_file = LOG_DIR / f"run_{ny_date.strftime('%Y%m%d')}.log"
-    
+
+    log_file = LOG_DIR / f"run_{run_date.strftime('%Y%m%d')}.log"
+
+    # The date-stamped filename already rotates the logs daily; prune
+    # everything but the newest 7 here instead of paying RotatingFileHandler's
+    # per-record size check
+    for old_log in sorted(LOG_DIR.glob("run_*.log"))[:-7]:
+        try:
+            old_log.unlink()
+        except OSError:
+            pass
+
+
     # Create logger
     logger = logging.getLogger('run_and_sync')
     logger.setLevel(logging.INFO)
-    
+    # Records never go to the root logger's handlers
+    logger.propagate = False
+
+    # None of the log formats use thread/process fields; skipping their
+    # per-record collection trims every LogRecord on the streaming path
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
     # Clear any existing handlers
     logger.handlers.clear()
     
     # Format for logs
-    formatter = logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s',
-                                  datefmt='%Y-%m-%d %H:%M:%S')
+    formatter = _CachedTimeFormatter('[%(asctime)s] [%(levelname)s] %(message)s',
+                                     datefmt='%Y-%m-%d %H:%M:%S')
     
     # Console handler (stdout)
     console_handler = logging.StreamHandler(sys.stdout)
@@ -83,56 +169,66 @@ def setup_logging():
     console_handler.setFormatter(formatter)
     logger.addHandler(console_handler)
     
-    # File handler with rotation (keep 7 days)
-    file_handler = RotatingFileHandler(
-        log_file,
-        maxBytes=10*1024*1024,  # 10MB
-        backupCount=7
-    )
+    # Plain file handler; daily rotation is handled by the filename and the
+    # pruning pass above. delay=True defers the file open until the first
+    # record actually reaches it through the MemoryHandler.
+    file_handler = logging.FileHandler(log_file, mode="a", encoding="utf-8", delay=True)
     file_handler.setLevel(logging.INFO)
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    
+
+    # Buffer file output: records reach the file handler in batches of 1024
+    # (or immediately on ERROR) instead of one write per record, which
+    # matters during the per-line script-output streaming. The console
+    # handler stays unbuffered so operators see live output.
+    memory_handler = MemoryHandler(
+        capacity=1024,
+        flushLevel=logging.ERROR,
+        target=file_handler
+    )
+    logger.addHandler(memory_handler)
+
     return logger
 
 
-def check_lockfile(logger):
-    """Check if lockfile exists and handle stale locks."""
-    if LOCKFILE.exists():
-        # Check if lockfile is stale
-        lock_age = time.time() - LOCKFILE.stat().st_mtime
-        lock_age_minutes = lock_age / 60
-        
-        if lock_age_minutes > LOCKFILE_STALE_MINUTES:
-            logger.warning(f"Lockfile is stale ({lock_age_minutes:.1f} minutes old). Removing.")
-            LOCKFILE.unlink()
-            return True
-        else:
-            logger.error(f"Lockfile exists and is recent ({lock_age_minutes:.1f} minutes old). Another instance may be running.")
-            return False
-    return True
+# Held open for the lifetime of the run; the kernel drops the flock when the
+# fd closes, including on a crash, so stale locks self-heal instantly
+_lock_fd = None
 
 
-def create_lockfile(logger):
-    """Create lockfile to prevent concurrent runs."""
+def acquire_lock(logger):
+    """Take an exclusive flock on the lockfile to prevent concurrent runs."""
+    global _lock_fd
     try:
         LOCKFILE.parent.mkdir(parents=True, exist_ok=True)
-        LOCKFILE.write_text(str(os.getpid()))
-        logger.info(f"Created lockfile: {LOCKFILE}")
+        fd = os.open(str(LOCKFILE), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            logger.error("Another instance holds the lock. Exiting.")
+            return False
+        # Record the holder PID for operators; the lock itself is the flock,
+        # not the file contents
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        _lock_fd = fd
+        logger.info(f"Acquired lock: {LOCKFILE}")
         return True
     except Exception as e:
-        logger.error(f"Failed to create lockfile: {e}")
+        logger.error(f"Failed to acquire lock: {e}")
         return False
 
 
-def remove_lockfile(logger):
-    """Remove lockfile."""
-    try:
-        if LOCKFILE.exists():
-            LOCKFILE.unlink()
-            logger.info("Removed lockfile")
-    except Exception as e:
-        logger.error(f"Failed to remove lockfile: {e}")
+def release_lock(logger):
+    """Release the flock by closing its fd; the lockfile itself stays put."""
+    global _lock_fd
+    if _lock_fd is not None:
+        try:
+            os.close(_lock_fd)
+            logger.info("Released lock")
+        except OSError as e:
+            logger.error(f"Failed to release lock: {e}")
+        _lock_fd = None
 
 
 def load_config(logger):
@@ -141,10 +237,11 @@ def load_config(logger):
         if not CONFIG_FILE.exists():
             logger.error(f"Configuration file not found: {CONFIG_FILE}")
             return None
-        
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
-        
+
+        # config.yaml rarely changes between cron runs; _load_config_file
+        # serves repeat runs from its JSON sidecar cache
+        config = _load_config_file(CONFIG_FILE)
+
         # Extract required fields
         git_token = config.get('git_token')
         if not git_token:
@@ -162,9 +259,7 @@ def load_config(logger):
             'git_user_email': git_user_email
         }
     except Exception as e:
-        logger.error(f"Failed to load configuration: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.error("Failed to load configuration: %s", e, exc_info=True)
         return None
 
 
@@ -184,16 +279,48 @@ def execute_script(logger):
             [sys.executable, str(SCRIPT_PATH)],
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
-            universal_newlines=True,
             cwd=str(BASE_DIR)
         )
-        
-        # Stream output to logs
-        for line in process.stdout:
-            logger.info(f"[SCRIPT] {line.rstrip()}")
-        
+
+        # Drain the pipe in 64KB chunks instead of waking once per line:
+        # read raw bytes, split on newlines in userspace, and keep any
+        # trailing partial line buffered until the rest arrives
+        fd = process.stdout.fileno()
+        os.set_blocking(fd, False)
+        pending = b""
+        # Coalesce lines into one log record per batch: 64 lines (or the
+        # 0.5s select tick during quiet stretches) per formatter pass and
+        # handler dispatch instead of one record per line
+        batch = []
+
+        def flush_batch():
+            if batch:
+                logger.info("[SCRIPT] " + "\n[SCRIPT] ".join(batch))
+                batch.clear()
+
+        while True:
+            ready, _, _ = select.select([fd], [], [], 0.5)
+            if not ready:
+                flush_batch()  # quiet moment: surface what has accumulated
+                continue
+            try:
+                chunk = os.read(fd, 65536)
+            except BlockingIOError:
+                continue
+            if not chunk:
+                break  # EOF: the child closed its end of the pipe
+            pending += chunk
+            lines = pending.split(b"\n")
+            pending = lines.pop()
+            for raw_line in lines:
+                batch.append(raw_line.decode('utf-8', errors='replace').rstrip())
+                if len(batch) >= 64:
+                    flush_batch()
+        if pending:
+            batch.append(pending.decode('utf-8', errors='replace').rstrip())
+        flush_batch()
+
+
         # Wait for process to complete
         return_code = process.wait()
         
@@ -212,42 +339,92 @@ def execute_script(logger):
             return False
             
     except Exception as e:
-        logger.error(f"Failed to execute script: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.error("Failed to execute script: %s", e, exc_info=True)
         return False
 
 
-def run_git_command(command, logger, cwd=None, retry=False):
-    """Run a git command with optional retry logic."""
+def _redact_command(command):
+    """Render an argv list for logging with any URL credentials masked."""
+    return ' '.join(re.sub(r'//[^/@]+@', '//***@', arg) for arg in command)
+
+
+def run_git_command(command, logger, cwd=None, retry=False, stream=False):
+    """Run a git command (argv list) with optional retry logic.
+
+    stream=True logs output lines as they arrive instead of buffering all
+    of stdout/stderr in memory first; use it for the network-bound
+    commands (fetch, rebase, push) whose output can be slow or large.
+    """
     max_attempts = MAX_RETRIES if retry else 1
-    
+
     for attempt in range(max_attempts):
         try:
             if attempt > 0:
                 delay = RETRY_BASE_DELAY * (2 ** (attempt - 1))
                 logger.info(f"Retry attempt {attempt + 1}/{max_attempts} after {delay}s delay")
                 time.sleep(delay)
-            
-            logger.info(f"Running: {command}")
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                cwd=cwd or str(BASE_DIR),
-                timeout=300  # 5 minute timeout
-            )
-            
-            if result.stdout:
-                logger.info(f"Output: {result.stdout.strip()}")
-            if result.stderr:
-                logger.warning(f"Stderr: {result.stderr.strip()}")
-            
-            if result.returncode == 0:
+
+            logger.info(f"Running: {_redact_command(command)}")
+            if stream:
+                process = subprocess.Popen(
+                    command,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    cwd=cwd or str(BASE_DIR)
+                )
+                # Same 5 minute budget as the buffered path below; iterating
+                # the pipe directly would block forever on a stalled remote,
+                # so drain it through select with an overall deadline
+                deadline = time.monotonic() + 300
+                fd = process.stdout.fileno()
+                os.set_blocking(fd, False)
+                pending = b""
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        process.kill()
+                        process.wait()
+                        raise subprocess.TimeoutExpired(command, 300)
+                    ready, _, _ = select.select([fd], [], [], min(remaining, 0.5))
+                    if not ready:
+                        continue
+                    try:
+                        chunk = os.read(fd, 65536)
+                    except BlockingIOError:
+                        continue
+                    if not chunk:
+                        break  # EOF: git closed its end of the pipe
+                    pending += chunk
+                    lines = pending.split(b"\n")
+                    pending = lines.pop()
+                    for raw_line in lines:
+                        line = raw_line.decode('utf-8', errors='replace').rstrip()
+                        if line:
+                            logger.info(f"Output: {line}")
+                if pending:
+                    line = pending.decode('utf-8', errors='replace').rstrip()
+                    if line:
+                        logger.info(f"Output: {line}")
+                returncode = process.wait()
+            else:
+                result = subprocess.run(
+                    command,
+                    capture_output=True,
+                    text=True,
+                    cwd=cwd or str(BASE_DIR),
+                    timeout=300  # 5 minute timeout
+                )
+
+                if result.stdout:
+                    logger.info(f"Output: {result.stdout.strip()}")
+                if result.stderr:
+                    logger.warning(f"Stderr: {result.stderr.strip()}")
+                returncode = result.returncode
+
+            if returncode == 0:
                 return True
             else:
-                logger.error(f"Command failed with return code: {result.returncode}")
+                logger.error(f"Command failed with return code: {returncode}")
                 if attempt < max_attempts - 1 and retry:
                     continue
                 return False
@@ -349,7 +526,35 @@ def restore_database_if_needed(backup_path, logger):
         pass
 
 
-def perform_git_operations(config, logger):
+def start_background_fetch():
+    """Fetch origin/main in a thread while the story script runs.
+
+    The fetch only touches .git and is independent of the local commit, so
+    its network latency hides entirely behind the (much longer) script
+    execution. Returns (thread, result) where result['ok'] records whether
+    the fetch succeeded.
+    """
+    result = {}
+
+    def _fetch():
+        try:
+            proc = subprocess.run(
+                ["git", "fetch", "--depth", "1", "origin", "main"],
+                cwd=str(BASE_DIR),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=300
+            )
+            result['ok'] = proc.returncode == 0
+        except Exception:
+            result['ok'] = False
+
+    thread = threading.Thread(target=_fetch, daemon=True)
+    thread.start()
+    return thread, result
+
+
+def perform_git_operations(config, logger, run_date, prefetch=None):
     """Perform git operations after successful script execution."""
     logger.info("=" * 60)
     logger.info("Starting git operations")
@@ -359,133 +564,159 @@ def perform_git_operations(config, logger):
     db_backup_path = backup_database(logger)
 
     try:
-        # Step 0: Verify we're in a git repository
-        logger.info("Step 0: Verifying git repository")
-        git_dir = BASE_DIR / ".git"
-        
-        if not git_dir.exists():
-            logger.error(f"Not a git repository: {BASE_DIR}")
-            logger.error("The .git directory does not exist. This typically happens when:")
-            logger.error("  1. The repository was not properly cloned")
-            logger.error("  2. The volume mount doesn't include the .git directory")
-            logger.error("  3. Running in a non-git directory")
-            logger.error("Skipping git operations.")
-            return False
-        
-        # Verify git is functional in this directory
+        # Steps 0-1: Mark the directory safe first (on mounted volumes
+        # rev-parse fails with "dubious ownership" until this is set), then
+        # verify the repository with a single rev-parse probe; its failure
+        # also covers the old BASE_DIR/.git existence check
+        logger.info("Steps 0-1: Marking directory safe and verifying git repository")
+        # Output is never inspected: DEVNULL skips the pipe setup and
+        # buffering that capture_output would pay for
+        subprocess.run(
+            ["git", "config", "--global", "--add", "safe.directory", str(BASE_DIR)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
         result = subprocess.run(
             ["git", "rev-parse", "--git-dir"],
             cwd=str(BASE_DIR),
             capture_output=True,
             text=True
         )
-        
+
         if result.returncode != 0:
             logger.error(f"Git repository verification failed: {result.stderr.strip()}")
+            logger.error(f"Not a usable git repository: {BASE_DIR}. This typically happens when:")
+            logger.error("  1. The repository was not properly cloned")
+            logger.error("  2. The volume mount doesn't include the .git directory")
+            logger.error("  3. Running in a non-git directory")
             logger.error("Skipping git operations.")
             return False
-        
+
         logger.info(f"Git repository verified at: {BASE_DIR}")
-        
-        # Step 1: Mark directory as safe for git (needed for mounted volumes)
-        logger.info("Step 1: Marking directory as safe for git")
-        subprocess.run(
-            ["git", "config", "--global", "--add", "safe.directory", str(BASE_DIR)],
+
+        # Clean-tree fast path: one status probe instead of the add/commit
+        # pair (and everything after it) on runs that produced no changes
+        status = subprocess.run(
+            ["git", "status", "--porcelain"],
+            cwd=str(BASE_DIR),
             capture_output=True
         )
-        
-        # Step 2: Configure git user
-        logger.info("Step 2: Configuring git user")
-        if not run_git_command(f'git config user.name "{config["git_user_name"]}"', logger):
-            logger.error("Failed to configure git user name")
-            return False
-        if not run_git_command(f'git config user.email "{config["git_user_email"]}"', logger):
-            logger.error("Failed to configure git user email")
-            return False
-        
-        # Step 3: Update remote URL with token
-        logger.info("Step 3: Updating git remote URL")
+        if status.returncode == 0 and not status.stdout.strip():
+            logger.info("Working tree clean; skipping git sync")
+            restore_database_if_needed(db_backup_path, logger)
+            return True
+
+
+        # Steps 2-3 (git config user.*, remote set-url) are folded into the
+        # commit and push commands below via -c flags and an explicit push
+        # URL, which saves three subprocess spawns per run and keeps the
+        # token out of .git/config
         remote_url = f"https://{config['git_token']}@github.com/sudoghut/trends-story.git"
-        if not run_git_command(f'git remote set-url origin {remote_url}', logger):
-            logger.error("Failed to update remote URL")
-            return False
-        
+
+
         # Step 4: Stage changes (files in .gitignore are automatically excluded)
         logger.info("Step 4: Staging changes")
         subprocess.run(
             ["git", "add", "--all", "--"],
             cwd=str(BASE_DIR),
-            capture_output=True
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
         )
         
-        # Step 5: Check if there are changes to commit
-        logger.info("Step 5: Checking for changes")
-        result = subprocess.run(
-            "git diff --cached --quiet",
-            shell=True,
-            cwd=str(BASE_DIR)
-        )
-        
-        if result.returncode != 0:
-            # There are changes to commit
-            # Get current date in NY timezone for commit message
-            ny_tz = datetime.timezone(datetime.timedelta(hours=-5))
-            ny_date = datetime.datetime.now(ny_tz)
-            commit_msg = f"Update news {ny_date.strftime('%Y%m%d')}"
-            
-            logger.info(f"Step 6: Creating commit: {commit_msg}")
-            if not run_git_command(f'git commit -m "{commit_msg}"', logger):
-                logger.error("Failed to create commit")
-                return False
-        else:
-            logger.info("No changes to commit, skipping commit step")
-            return True
-        
-        # Step 7: Fetch from origin (shallow to save space)
-        logger.info("Step 7: Fetching from origin (shallow)")
-        if not run_git_command("git fetch --depth 1 origin main", logger, retry=True):
-            logger.error("Failed to fetch from origin")
-            return False
-        
-        # Step 8: Rebase on origin/main
-        logger.info("Step 8: Rebasing on origin/main")
+        # Steps 5-6: Commit staged changes. git commit already exits
+        # non-zero with "nothing to commit" on a clean index, so the
+        # separate git diff --cached probe (one more process and a second
+        # full index diff right after git add) is unnecessary
+        commit_msg = f"Update news {run_date.strftime('%Y%m%d')}"
+
+        logger.info(f"Steps 5-6: Creating commit: {commit_msg}")
         result = subprocess.run(
-            "git rebase origin/main",
-            shell=True,
+            ["git",
+             "-c", f"user.name={config['git_user_name']}",
+             "-c", f"user.email={config['git_user_email']}",
+             "commit", "-m", commit_msg],
             capture_output=True,
             text=True,
             cwd=str(BASE_DIR)
         )
-        
+
         if result.returncode != 0:
-            logger.error("Rebase failed - conflicts detected")
-            logger.error(f"Rebase output: {result.stdout}")
-            logger.error(f"Rebase errors: {result.stderr}")
-            # Abort the rebase
-            run_git_command("git rebase --abort", logger)
-            return False
-        
-        logger.info("Rebase completed successfully")
-        
-        # Step 9: Push changes
-        logger.info("Step 9: Pushing to origin/main")
-        if not run_git_command("git push origin main", logger, retry=True):
-            logger.error("Failed to push changes")
+            if "nothing to commit" in result.stdout:
+                logger.info("No changes to commit, skipping commit step")
+                return True
+            logger.error("Failed to create commit")
+            if result.stdout:
+                logger.error(f"Output: {result.stdout.strip()}")
+            if result.stderr:
+                logger.error(f"Stderr: {result.stderr.strip()}")
             return False
 
+
+        push_command = ["git", "push", remote_url, "HEAD:main"]
+
+        # Optimistic fast path: if the last successful sync was minutes ago,
+        # the remote almost certainly has not moved, so try the push before
+        # paying for a fetch and rebase. A rejected push falls through to
+        # the normal fetch+rebase path.
+        pushed = False
+        try:
+            last_run = datetime.datetime.fromisoformat(LAST_RUN_FILE.read_text().strip())
+            recent_sync = (datetime.datetime.now(datetime.timezone.utc) - last_run
+                           < datetime.timedelta(minutes=5))
+        except (OSError, ValueError):
+            recent_sync = False
+
+        if recent_sync:
+            logger.info("Last sync was recent; attempting push without fetch")
+            pushed = run_git_command(push_command, logger, stream=True)
+            if not pushed:
+                logger.info("Direct push rejected; falling back to fetch and rebase")
+
+        if not pushed:
+            # Step 7: Fetch from origin (shallow to save space), unless the
+            # background fetch started before the script run already did it
+            fetched = False
+            if prefetch is not None:
+                fetch_thread, fetch_result = prefetch
+                fetch_thread.join(timeout=60)
+                fetched = fetch_result.get('ok', False)
+                if fetched:
+                    logger.info("Step 7: origin/main already fetched in the background")
+            if not fetched:
+                logger.info("Step 7: Fetching from origin (shallow)")
+                if not run_git_command(["git", "fetch", "--depth", "1", "origin", "main"], logger, retry=True, stream=True):
+                    logger.error("Failed to fetch from origin")
+                    return False
+
+            # Step 8: Rebase on origin/main
+            logger.info("Step 8: Rebasing on origin/main")
+            if not run_git_command(["git", "rebase", "origin/main"], logger, stream=True):
+                # The streamed output above already shows the conflicts
+                logger.error("Rebase failed - conflicts detected")
+                # Abort the rebase
+                run_git_command(["git", "rebase", "--abort"], logger)
+                return False
+
+            logger.info("Rebase completed successfully")
+
+            # Step 9: Push changes
+            logger.info("Step 9: Pushing to origin/main")
+            if not run_git_command(push_command, logger, retry=True, stream=True):
+                logger.error("Failed to push changes")
+                return False
+
         # Step 10: Clean up git objects to prevent .git bloat
         logger.info("Step 10: Cleaning up git objects")
-        run_git_command("git reflog expire --expire=now --all", logger)
-        run_git_command("git gc --prune=now", logger)
+        run_git_command(["git", "reflog", "expire", "--expire=now", "--all"], logger)
+        run_git_command(["git", "gc", "--prune=now"], logger)
 
         logger.info("Git operations completed successfully")
         restore_database_if_needed(db_backup_path, logger)
         return True
 
     except Exception as e:
-        logger.error(f"Git operations failed: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.error("Git operations failed: %s", e, exc_info=True)
         restore_database_if_needed(db_backup_path, logger)
         return False
 
@@ -504,7 +735,10 @@ def update_last_run_timestamp(logger):
 
 def main():
     """Main execution function."""
-    logger = setup_logging()
+    # One date for the whole run: the log filename and the commit message
+    # stay in agreement even if the run crosses midnight NY time
+    run_date = datetime.datetime.now(NY_TZ)
+    logger = setup_logging(run_date)
     exit_code = EXIT_SUCCESS
     
     try:
@@ -512,11 +746,8 @@ def main():
         logger.info("Run and Sync Script Started")
         logger.info("=" * 60)
         
-        # Check and create lockfile
-        if not check_lockfile(logger):
-            return EXIT_CONFIG_ERROR
-        
-        if not create_lockfile(logger):
+        # Take the single-instance lock
+        if not acquire_lock(logger):
             return EXIT_CONFIG_ERROR
         
         # Load configuration
@@ -524,6 +755,11 @@ def main():
         if not config:
             return EXIT_CONFIG_ERROR
         
+        # Start the remote fetch now so it completes while the (much
+        # longer) story script runs; a failure here just means the git
+        # phase fetches normally
+        prefetch = start_background_fetch()
+
         # Execute the main script
         script_success = execute_script(logger)
         
@@ -532,7 +768,7 @@ def main():
             exit_code = EXIT_SCRIPT_FAILURE
         else:
             # Perform git operations only if script succeeded
-            git_success = perform_git_operations(config, logger)
+            git_success = perform_git_operations(config, logger, run_date, prefetch=prefetch)
             
             if not git_success:
                 logger.error("Git operations failed")
@@ -546,16 +782,17 @@ def main():
         logger.warning("Execution interrupted by user")
         exit_code = EXIT_SCRIPT_FAILURE
     except Exception as e:
-        logger.error(f"Unexpected error: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.error("Unexpected error: %s", e, exc_info=True)
         exit_code = EXIT_SCRIPT_FAILURE
     finally:
-        # Always clean up lockfile
-        remove_lockfile(logger)
+        # Always release the single-instance lock
+        release_lock(logger)
         logger.info("=" * 60)
         logger.info(f"Run and Sync Script Finished (exit code: {exit_code})")
         logger.info("=" * 60)
+        # Push any records still buffered in the MemoryHandler to the file
+        for handler in logger.handlers:
+            handler.flush()
     
     return exit_code
 
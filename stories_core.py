@@ -0,0 +1,373 @@
+"""Helpers shared by the creating-stories entrypoint variants.
+
+Both entrypoints (WordCloud and ComfyUI image backends) fetch the same
+trending data, talk to the same story-generation queue, and publish the same
+sitemap; those pieces live here so each variant stays a thin driver.
+"""
+
+import serpapi
+import json
+import orjson
+import sqlite3
+import asyncio
+import websockets
+from websockets.protocol import State
+import hashlib
+import os
+import re
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import xml.etree.ElementTree as ET
+from tenacity import AsyncRetrying, RetryError, stop_after_attempt, wait_random_exponential
+
+from config import get_api_key
+
+# New York timezone
+NY_TZ = ZoneInfo("America/New_York")
+
+WS_URL = "wss://queue.oopus.info"
+WS_RESPONSE_TIMEOUT = 60
+MAX_RETRIES = 4
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant."
+
+# Request scaffolding serialized once at import; each send only has to encode
+# the dynamic prompt and splice it into the placeholder slot
+_REQ_TEMPLATE = orjson.dumps({
+    "type": "request",
+    "parameters": {
+        "prompt": "__PROMPT__",
+        "system_prompt": DEFAULT_SYSTEM_PROMPT,
+        "llm": "gemini",
+        "search": 1,
+    },
+})
+
+def open_db(db_name, check_same_thread=True):
+    """Open a SQLite connection tuned for write throughput
+
+    WAL journaling persists on the database file after the first use, but the
+    remaining PRAGMAs are per-connection, so issue all of them on every open.
+    Pass check_same_thread=False for a connection shared with to_thread
+    workers; SQLite's serialized mode keeps cross-thread statements safe.
+    """
+    # isolation_level=None leaves transaction control to the explicit
+    # BEGIN/COMMIT calls instead of pysqlite's implicit transactions
+    conn = sqlite3.connect(db_name, isolation_level=None,
+                           check_same_thread=check_same_thread)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-65536')
+    conn.execute('PRAGMA busy_timeout=5000')
+    # Memory-map up to 256MB of the database file so reads come out of the
+    # page cache without a read() syscall per page; a no-op where mmap is
+    # unavailable
+    conn.execute('PRAGMA mmap_size=268435456')
+    return conn
+
+# Built once at import; sanitize_filename runs in per-story hot paths.
+# One table drops the invalid characters and maps spaces to hyphens in a
+# single C-level pass over the string.
+_FILENAME_TABLE = str.maketrans(' ', '-', '<>:"/\\|?*')
+_MULTI_HYPHEN_RE = re.compile(r'-+')
+
+def ensure_indexes(conn):
+    """Create the hot-path indexes if missing
+
+    Long-lived databases were bootstrapped before create_db.py grew these
+    indexes, so the entrypoints call this once at startup; IF NOT EXISTS
+    makes it a no-op afterwards.
+    """
+    conn.executescript('''
+        CREATE INDEX IF NOT EXISTS idx_main_news_serpapi_id
+            ON main_news_data (serpapi_id);
+        CREATE INDEX IF NOT EXISTS idx_main_news_date
+            ON main_news_data (date);
+        CREATE INDEX IF NOT EXISTS idx_serpapi_date_cat_query
+            ON serpapi_data (date, categories, query, id);
+    ''')
+
+def sanitize_filename(filename):
+    """Remove characters that can't be used in Windows and Mac filenames"""
+    # Drop invalid characters and turn spaces into hyphens in one pass
+    sanitized = filename.translate(_FILENAME_TABLE)
+    # Remove multiple consecutive hyphens
+    sanitized = _MULTI_HYPHEN_RE.sub('-', sanitized)
+    # Remove leading/trailing hyphens
+    sanitized = sanitized.strip('-')
+    # Limit length to avoid filesystem issues
+    return sanitized[:100]
+
+def get_trending_searches():
+    params = {
+        "engine": "google_trends_trending_now",
+        "geo": "US",
+        "api_key": get_api_key()
+    }
+    # search = GoogleSearch(params)
+    search = serpapi.search(params)
+    results = search.as_dict()
+    return results
+
+def load_trending_searches(file_path):
+    # orjson parses the dump several times faster than stdlib json; the file
+    # is a single bounded API response, so no streaming parser is needed
+    with open(file_path, "rb") as file:
+        return orjson.loads(file.read())
+
+def format_categories(categories):
+    """Format categories as {id1}-{name1}|{id2}-{name2}"""
+    # Generator form skips the intermediate list allocation per row
+    return "|".join(f"{cat['id']}-{cat['name']}" for cat in categories) if categories else ""
+
+def format_trend_breakdown(trend_breakdown):
+    """Format trend_breakdown as {term1}|{term2}..."""
+    return "|".join(trend_breakdown) if trend_breakdown else ""
+
+async def _recv_result(websocket):
+    """Collect messages until a result payload arrives and return its content"""
+    async for message in websocket:
+        print("Received:", message)
+        try:
+            parsed_message = json.loads(message)
+            if parsed_message.get("type") == "result":
+                data = parsed_message.get("data", {})
+                if "Ok" in data:
+                    return data["Ok"].get("content", "")
+        except json.JSONDecodeError:
+            continue
+    return None
+
+async def ws_send_prompt(websocket, prompt, system_prompt=DEFAULT_SYSTEM_PROMPT):
+    """Send prompt over an already-open websocket and return the response"""
+    response_content = None
+
+    try:
+        # Send the request; the common case splices the prompt into the
+        # pre-serialized template instead of re-encoding the whole payload
+        if system_prompt == DEFAULT_SYSTEM_PROMPT:
+            payload = _REQ_TEMPLATE.replace(b'"__PROMPT__"', orjson.dumps(prompt))
+        else:
+            payload = orjson.dumps({
+                "type": "request",
+                "parameters": {
+                    "prompt": prompt,
+                    "system_prompt": system_prompt,
+                    "llm": "gemini",
+                    "search": 1,
+                },
+            })
+        await websocket.send(payload)
+        print("Sent to server:", payload.decode("utf-8"))
+
+        # Bound the wait so a stalled peer can't hold a worker slot forever
+        response_content = await asyncio.wait_for(
+            _recv_result(websocket), timeout=WS_RESPONSE_TIMEOUT)
+
+    except asyncio.TimeoutError:
+        raise Exception(f"No websocket response within {WS_RESPONSE_TIMEOUT} seconds")
+    except websockets.exceptions.ConnectionClosed:
+        # Normal connection closure after receiving data is not an error
+        pass
+    except Exception as e:
+        if response_content is None:  # Only raise if we didn't get valid content
+            print("WebSocket error:", str(e))
+            raise e
+
+    if response_content is None:
+        raise Exception("No valid response content received")
+
+    return response_content
+
+_LLM_CACHE_DB = 'trends_data.db'
+_llm_cache_conn = None
+
+def _llm_cache():
+    """Lazily open the cache connection and make sure the table exists"""
+    global _llm_cache_conn
+    if _llm_cache_conn is None:
+        _llm_cache_conn = open_db(_LLM_CACHE_DB)
+        _llm_cache_conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                hash TEXT PRIMARY KEY,
+                response TEXT,
+                ts INTEGER
+            )
+        ''')
+    return _llm_cache_conn
+
+def _llm_cache_key(prompt, system_prompt):
+    return hashlib.sha256(f"{prompt}\x00{system_prompt}".encode()).hexdigest()
+
+def _log_retry(retry_state):
+    """Report a failed attempt before tenacity sleeps"""
+    print(f"Attempt {retry_state.attempt_number} failed: {retry_state.outcome.exception()}")
+
+async def call_api_with_retry(prompt, system_prompt=DEFAULT_SYSTEM_PROMPT, websocket=None):
+    """Create a story with retry logic
+
+    Retries use randomized exponential backoff so concurrent workers don't
+    all hammer the server at the same instant after a rate-limit spike.
+    Reuses the caller's websocket when one is passed in (amortizing the
+    TCP+TLS handshake over several prompts); otherwise connects on demand
+    and reconnects if the server closed the connection between attempts.
+    """
+    if not prompt:
+        return None
+
+    # Same-day reruns and crash-recovery retries hit identical prompts; a
+    # cache lookup is microseconds against seconds of LLM latency
+    cache_key = _llm_cache_key(prompt, system_prompt)
+    cached = _llm_cache().execute(
+        'SELECT response FROM llm_cache WHERE hash = ?', (cache_key,)).fetchone()
+    if cached:
+        print("LLM cache hit, skipping remote call")
+        return cached[0]
+
+    owned_websocket = None
+    try:
+        async for attempt in AsyncRetrying(
+            wait=wait_random_exponential(multiplier=1, max=300),
+            stop=stop_after_attempt(MAX_RETRIES),
+            before_sleep=_log_retry,
+        ):
+            with attempt:
+                # State works on both the legacy protocol and the asyncio
+                # implementation that connect() returns since websockets 14;
+                # the old .closed attribute only exists on the former
+                if websocket is None or websocket.state is not State.OPEN:
+                    # compression=None skips permessage-deflate on the small
+                    # JSON payloads; max_size=None trusts the queue server
+                    owned_websocket = await websockets.connect(
+                        WS_URL, compression=None, max_size=None)
+                    websocket = owned_websocket
+                response = await ws_send_prompt(websocket, prompt, system_prompt)
+                _llm_cache().execute(
+                    'INSERT OR REPLACE INTO llm_cache (hash, response, ts) VALUES (?, ?, ?)',
+                    (cache_key, response, int(time.time())))
+                return response
+    except RetryError:
+        pass
+    finally:
+        if owned_websocket is not None:
+            try:
+                await owned_websocket.close()
+            except Exception:
+                pass
+
+    print(f"Failed to create story after {MAX_RETRIES} attempts")
+    return None
+
+def _parse_existing_sitemap(sitemap_path, namespace):
+    """Collect {loc: lastmod} from an existing sitemap, homepage excluded.
+
+    Uses iterparse and clears each element after reading it, so memory stays
+    bounded to one <url> regardless of how large the archive has grown.
+    """
+    existing_urls = {}
+    try:
+        for _, elem in ET.iterparse(sitemap_path, events=('end',)):
+            if elem.tag == f'{{{namespace}}}url':
+                loc_elem = elem.find(f'{{{namespace}}}loc')
+                lastmod_elem = elem.find(f'{{{namespace}}}lastmod')
+                if loc_elem is not None and loc_elem.text:
+                    loc = loc_elem.text.strip()
+                    lastmod = lastmod_elem.text.strip() if lastmod_elem is not None else None
+                    # Skip homepage - will be regenerated with current timestamp
+                    if loc != 'https://trending.oopus.info/':
+                        existing_urls[loc] = lastmod
+                elem.clear()
+        print(f"Parsed {len(existing_urls)} existing URLs from sitemap")
+    except ET.ParseError as e:
+        print(f"Warning: Could not parse existing sitemap: {e}. Creating new sitemap.")
+        existing_urls = {}
+    except Exception as e:
+        print(f"Warning: Error reading existing sitemap: {e}. Creating new sitemap.")
+        existing_urls = {}
+    return existing_urls
+
+def generate_sitemap(conn):
+    """Generate sitemap.xml with homepage and all historical date pages.
+    Intelligently merges with existing sitemap if it exists.
+
+    Runs on the caller's connection so the whole pipeline shares one warm
+    page cache. SQLite dedups and sorts the dates, and entries are streamed
+    straight to the file in that order, so there is no merged dict copy or
+    Python-side sort. Entries found only in the old sitemap (not in the
+    database) are preserved and appended after the database-backed ones.
+    """
+    sitemap_path = 'sitemap.xml'
+    namespace = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+    # Parse any existing sitemap first so entries can be merged as we stream
+    existing_urls = {}
+    if os.path.exists(sitemap_path):
+        print(f"Existing sitemap found at {sitemap_path}, parsing and merging...")
+        existing_urls = _parse_existing_sitemap(sitemap_path, namespace)
+
+    # The date column is 'YYYY-MM-DD HH:MM:SS' text; SUBSTR gives the day and
+    # ORDER BY keeps the output chronological without a Python-side sort
+    cursor = conn.execute(
+        "SELECT DISTINCT SUBSTR(date, 1, 10) AS d FROM main_news_data ORDER BY d ASC")
+
+    current_date = datetime.now(NY_TZ).strftime("%Y-%m-%d")
+    new_count = 0
+    updated_count = 0
+    preserved_count = 0
+    total_count = 1  # homepage
+
+    # Write to a temp file and swap in atomically so a crash mid-write never
+    # leaves a truncated sitemap behind
+    tmp_path = sitemap_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+
+        # Homepage first with current timestamp
+        f.write('  <url>\n'
+                '    <loc>https://trending.oopus.info/</loc>\n'
+                f'    <lastmod>{current_date}</lastmod>\n'
+                '  </url>\n')
+
+        for (day,) in cursor:
+            url = f'https://trending.oopus.info/date/{day.replace("-", "")}'
+            if url in existing_urls:
+                # ISO dates compare correctly as strings; keep the newer one
+                existing_lastmod = existing_urls.pop(url)
+                if existing_lastmod and existing_lastmod >= day:
+                    lastmod = existing_lastmod
+                    preserved_count += 1
+                else:
+                    lastmod = day
+                    updated_count += 1
+            else:
+                lastmod = day
+                new_count += 1
+            f.write('  <url>\n'
+                    f'    <loc>{url}</loc>\n'
+                    f'    <lastmod>{lastmod}</lastmod>\n'
+                    '  </url>\n')
+            total_count += 1
+
+        # Entries only present in the old sitemap (sorted for stable output)
+        for url in sorted(existing_urls):
+            lastmod = existing_urls[url]
+            f.write('  <url>\n'
+                    f'    <loc>{url}</loc>\n'
+                    f'    <lastmod>{lastmod if lastmod else current_date}</lastmod>\n'
+                    '  </url>\n')
+            preserved_count += 1
+            total_count += 1
+
+        f.write('</urlset>\n')
+
+    os.replace(tmp_path, sitemap_path)
+
+    print(f"Successfully generated sitemap at: {sitemap_path}")
+    print(f"  Total URLs: {total_count} (including homepage)")
+    print(f"  New entries: {new_count}")
+    print(f"  Updated entries: {updated_count}")
+    print(f"  Preserved entries: {preserved_count}")
+
+    return sitemap_path